@@ -10,6 +10,9 @@ class AnalysisRequest(BaseModel):
     image_id: str
     prompt: Optional[str] = None
 
+class BatchAnalysisRequest(BaseModel):
+    image_ids: List[str]
+
 class AnalysisResponse(BaseModel):
     image_id: str
     diagnosis: str
@@ -41,3 +44,29 @@ class ImageData(BaseModel):
     file_path: str # Path to the processed image (ready for Gemini/Web)
     metadata: ImageMetadata
     thumbnail_path: Optional[str] = None
+    content_hash: Optional[str] = None # SHA-256 of the processed pixel data
+    upload_sha256: Optional[str] = None # SHA-256 of the uploaded file bytes
+
+
+class SeriesInstance(BaseModel):
+    sop_instance_uid: str
+    instance_number: Optional[int] = None
+    file_path: str
+    frames: int = 1
+    rows: int
+    columns: int
+    pixel_offset: Optional[int] = None # Byte offset of uncompressed pixel data; None means it must be decoded
+
+
+class SeriesData(BaseModel):
+    series_id: str
+    series_instance_uid: str
+    study_instance_uid: Optional[str] = None
+    modality: str
+    body_part: Optional[str] = None
+    frame_count: int
+    instances: List[SeriesInstance]
+
+
+class KeyImageRequest(BaseModel):
+    frame_index: int
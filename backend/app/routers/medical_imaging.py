@@ -1,94 +1,261 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from app.services.image_processor import ImageProcessor
-from app.services.gemini_service import GeminiService
-from app.models.schemas import ImageData, AnalysisResponse, AnalysisRequest, ReportRequest
+from app.services.gemini_service import GeminiService, PROMPT_VERSION
+from app.services.analysis_cache import AnalysisCache
+from app.services.worker_pool import PoolBusyError
+from app.services.upload_stream import StreamingUploadParser, UploadTooLargeError
+from app.services.dicom_series import SeriesStore, SERIES_MAX_FILES, SERIES_MAX_SIZE
+from app.services.analysis_scheduler import AnalysisScheduler, ANALYSIS_BATCH_MAX
+from app.models.schemas import ImageData, AnalysisResponse, AnalysisRequest, ReportRequest, SeriesData, KeyImageRequest, BatchAnalysisRequest
+from typing import List
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 import os
 import uuid
+import json
 
 router = APIRouter()
 image_processor = ImageProcessor()
 gemini_service = GeminiService()
+analysis_cache = AnalysisCache()
+upload_parser = StreamingUploadParser()
+analysis_scheduler = AnalysisScheduler()
+series_store = SeriesStore(pool=image_processor.pool)
+series_upload_parser = StreamingUploadParser(
+    field_name="files",
+    max_size=SERIES_MAX_SIZE,
+    allowed_extensions={".dcm", ".zip"},
+    max_files=SERIES_MAX_FILES,
+    max_total_size=SERIES_MAX_SIZE
+)
 
 # In-memory storage for results (replace with DB in production)
 analysis_results = {}
 image_metadata_store = {}
 
-@router.post("/api/upload-image", response_model=ImageData)
-async def upload_image(file: UploadFile = File(...)):
+# The body is parsed by StreamingUploadParser rather than FastAPI's File(), so describe it for the docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
+
+@router.post("/api/upload-image", response_model=ImageData, openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_image(request: Request):
+    upload = None
     try:
-        content = await file.read()
-        image_data = await image_processor.save_and_process(content, file.filename)
+        # Streams the multipart body to a spool file; oversize or non-image uploads are cut off mid-transfer
+        upload = await upload_parser.parse(request)
+        image_data = await image_processor.save_and_process_file(upload.path, upload.filename, upload.sha256)
         image_metadata_store[image_data.image_id] = image_data
         return image_data
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except PoolBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if upload is not None:
+            upload.cleanup()
 
-@router.post("/api/analyze-image", response_model=AnalysisResponse)
-async def analyze_image(request: AnalysisRequest):
-    image_id = request.image_id
+SERIES_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                    "required": ["files"]
+                }
+            }
+        }
+    }
+}
+
+@router.post("/api/upload-series", response_model=List[SeriesData], openapi_extra=SERIES_REQUEST_BODY)
+async def upload_series(request: Request):
+    uploads = []
+    try:
+        # Any mix of .dcm files and .zip archives; only headers are read here
+        uploads = await series_upload_parser.parse_many(request)
+        return await series_store.ingest([upload.path for upload in uploads])
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except PoolBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        for upload in uploads:
+            upload.cleanup()
+
+def _get_series(series_id: str) -> SeriesData:
+    series = series_store.get(series_id)
+    if series is None:
+        raise HTTPException(status_code=404, detail="Series not found")
+    return series
+
+@router.get("/api/series/{series_id}", response_model=SeriesData)
+async def get_series(series_id: str):
+    return _get_series(series_id)
+
+@router.get("/api/series/{series_id}/frames/{frame_index}")
+async def get_series_frame(series_id: str, frame_index: int, thumbnail: bool = False):
+    series = _get_series(series_id)
+    try:
+        path = await series_store.render_frame(series, frame_index, thumbnail=thumbnail)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Frame not found")
+    except PoolBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    return FileResponse(path, media_type="image/png")
+
+@router.post("/api/series/{series_id}/thumbnails")
+async def render_series_thumbnails(series_id: str):
+    series = _get_series(series_id)
+    try:
+        paths = await series_store.render_thumbnails(series)
+    except PoolBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    return {"series_id": series_id, "thumbnails": paths}
+
+@router.post("/api/series/{series_id}/key-image", response_model=ImageData)
+async def create_key_image(series_id: str, request: KeyImageRequest):
+    """Promotes one frame to a regular image so it can be analyzed and reported on."""
+    series = _get_series(series_id)
+    try:
+        frame_path = await series_store.render_frame(series, request.frame_index)
+        image_data = await image_processor.save_and_process_file(frame_path, f"{series_id}_{request.frame_index}.png")
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Frame not found")
+    except PoolBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    image_data.metadata.modality = series.modality
+    image_data.metadata.body_part = series.body_part
+    image_metadata_store[image_data.image_id] = image_data
+    return image_data
+
+def build_analysis_response(image_id: str, result: dict) -> AnalysisResponse:
+    """Maps the rich Gemini JSON onto AnalysisResponse."""
+    # Our AnalysisResponse model in schemas.py is:
+    # image_id, diagnosis, confidence, details
+    # diagnosis -> differential_diagnosis[0].condition
+    # confidence -> differential_diagnosis[0].probability
+    # details -> the whole result object
+    top_diagnosis = "Unknown"
+    confidence = 0.0
+
+    if result.get("differential_diagnosis") and len(result["differential_diagnosis"]) > 0:
+        top = result["differential_diagnosis"][0]
+        top_diagnosis = top.get("condition", "Unknown")
+        # probability might be string "90%" or int 90. Logic to parse:
+        prob = str(top.get("probability", "0")).replace("%", "")
+        try:
+            confidence = float(prob) / 100.0 if float(prob) > 1 else float(prob)
+        except:
+            confidence = 0.0
+
+    return AnalysisResponse(
+        image_id=image_id,
+        diagnosis=top_diagnosis,
+        confidence=confidence,
+        details=result
+    )
+
+async def run_analysis(image_id: str) -> AnalysisResponse:
+    """Analyzes one stored image. Raises LookupError for unknown ids and RuntimeError on model failure."""
     if image_id not in image_metadata_store:
-        raise HTTPException(status_code=404, detail="Image not found")
-    
+        raise LookupError("Image not found")
+
     image_data = image_metadata_store[image_id]
-    
-    try:
-        # Use Gemini Service
-        # We need to construct the image path or pass bytes. 
-        # gemini_service.analyze_medical_image expects image_path and image_type.
-        
-        # Determine image type for prompt
-        image_type = image_data.metadata.modality
-        
-        result = await gemini_service.analyze_medical_image(
-            image_path=image_data.file_path,
-            image_type=image_type
+    # Determine image type for prompt
+    image_type = image_data.metadata.modality
+
+    # Identical pixels + identical model settings -> reuse the previous analysis
+    cache_key = None
+    if image_data.content_hash:
+        cache_key = AnalysisCache.make_key(
+            image_data.content_hash,
+            image_type,
+            PROMPT_VERSION,
+            gemini_service.cache_fingerprint()
         )
-        
+
+    result = analysis_cache.get(cache_key) if cache_key else None
+    if result is None:
+        # Waits for a free slot so bursts never exceed ANALYSIS_MAX_IN_FLIGHT model calls
+        result = await analysis_scheduler.run(gemini_service.analyze_medical_image, image_data.file_path, image_type)
+
         if "error" in result:
-             raise HTTPException(status_code=500, detail=result["error"])
+            raise RuntimeError(result["error"])
 
-        # Construct AnalysisResponse
-        # Note: result keys match requirements but we need to map to our pydantic model if needed
-        # Our AnalysisResponse model in schemas.py is:
-        # image_id, diagnosis, confidence, details
-        
-        # We need to adapt the rich JSON from Gemini to this simple model or update the model.
-        # The prompt asked for specific JSON structure from Gemini, but schemas.py has a simpler structure.
-        # Let's map it:
-        # diagnosis -> findings (summary) or differential_diagnosis[0].condition
-        # confidence -> differential_diagnosis[0].probability
-        # details -> the whole result object
-        
-        top_diagnosis = "Unknown"
-        confidence = 0.0
-        
-        if result.get("differential_diagnosis") and len(result["differential_diagnosis"]) > 0:
-            top = result["differential_diagnosis"][0]
-            top_diagnosis = top.get("condition", "Unknown")
-            # probability might be string "90%" or int 90. Logic to parse:
-            prob = str(top.get("probability", "0")).replace("%", "")
-            try:
-                confidence = float(prob) / 100.0 if float(prob) > 1 else float(prob)
-            except:
-                confidence = 0.0
-
-        response = AnalysisResponse(
-            image_id=image_id,
-            diagnosis=top_diagnosis,
-            confidence=confidence,
-            details=result
-        )
-        
-        analysis_results[image_id] = response
-        return response
+        if cache_key:
+            analysis_cache.put(cache_key, result)
+
+    response = build_analysis_response(image_id, result)
+    analysis_results[image_id] = response
+    return response
 
+@router.post("/api/analyze-image", response_model=AnalysisResponse)
+async def analyze_image(request: AnalysisRequest):
+    try:
+        return await run_analysis(request.image_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/api/analyze-batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """Streams one NDJSON line per image as each analysis completes, then a summary line."""
+    image_ids = list(dict.fromkeys(request.image_ids)) # Drop duplicates, keep order
+    if not image_ids:
+        raise HTTPException(status_code=400, detail="image_ids must not be empty")
+    if len(image_ids) > ANALYSIS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {ANALYSIS_BATCH_MAX} images per batch")
+
+    async def stream():
+        succeeded = 0
+        async for image_id, response, error in analysis_scheduler.map_as_completed(run_analysis, image_ids):
+            if error is None:
+                succeeded += 1
+                line = {"image_id": image_id, "status": "done", "result": jsonable_encoder(response)}
+            else:
+                line = {
+                    "image_id": image_id,
+                    "status": "failed",
+                    "status_code": 404 if isinstance(error, LookupError) else 500,
+                    "error": str(error)
+                }
+            yield json.dumps(line) + "\n"
+        yield json.dumps({"summary": {"total": len(image_ids), "succeeded": succeeded, "failed": len(image_ids) - succeeded}}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/api/cache/stats")
+async def get_cache_stats():
+    return analysis_cache.stats()
+
 @router.get("/api/diagnosis/{image_id}", response_model=AnalysisResponse)
 async def get_diagnosis(image_id: str):
     if image_id in analysis_results:
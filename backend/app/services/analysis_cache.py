@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Configuration
+ANALYSIS_CACHE_SIZE = int(os.environ.get("ANALYSIS_CACHE_SIZE", "512"))  # Entries kept in memory
+ANALYSIS_CACHE_DIR = os.environ.get("ANALYSIS_CACHE_DIR", "cache/analysis")
+
+
+class AnalysisCache:
+    """
+    Two-tier cache for Gemini analysis results.
+
+    Entries are keyed by a hash of the processed pixel data, the modality and the
+    model settings, so the same study uploaded twice under different image_ids
+    resolves to the same entry. A bounded in-memory LRU sits in front of a JSON
+    file per entry on disk, which survives restarts.
+    """
+
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_SIZE, cache_dir: Optional[str] = ANALYSIS_CACHE_DIR):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash: str, modality: str, prompt_version: str, generation_config: dict) -> str:
+        """Builds the cache key for an analysis request."""
+        payload = json.dumps(
+            {
+                "content": content_hash,
+                "modality": modality,
+                "prompt_version": prompt_version,
+                "generation_config": generation_config,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        """Returns the cached result for key, or None."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        result = self._read_disk(key)
+        if result is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, result)
+        return result
+
+    def put(self, key: str, result: dict) -> None:
+        """Stores a result in both tiers."""
+        with self._lock:
+            self._remember(key, result)
+        self._write_disk(key, result)
+
+    def _remember(self, key: str, result: dict) -> None:
+        # Caller holds the lock
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _read_disk(self, key: str) -> Optional[dict]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, result: dict) -> None:
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(result, f)
+            # Atomic so concurrent readers never see a partial file
+            os.replace(tmp_path, path)
+        except OSError:
+            # The disk tier is best effort; the memory tier still holds the entry
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self) -> dict:
+        """Returns hit/miss/eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
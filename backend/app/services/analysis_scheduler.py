@@ -0,0 +1,67 @@
+import os
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Optional, Tuple
+
+# Configuration
+ANALYSIS_MAX_IN_FLIGHT = int(os.environ.get("ANALYSIS_MAX_IN_FLIGHT", "4"))  # Concurrent model calls per process
+ANALYSIS_BATCH_MAX = int(os.environ.get("ANALYSIS_BATCH_MAX", "500"))  # image_ids per batch request
+
+
+class AnalysisScheduler:
+    """
+    Caps the number of model calls in flight across all requests in this process.
+
+    Batch callers use map_as_completed to fan a list out through the cap and get
+    each outcome back as soon as it finishes; a failing item is returned as its
+    exception rather than aborting the rest.
+    """
+
+    def __init__(self, max_in_flight: int = ANALYSIS_MAX_IN_FLIGHT):
+        self.max_in_flight = max(1, max_in_flight)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created on first use so it binds to the server's running loop (Python 3.9 binds at construction)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphore
+
+    async def run(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """Awaits fn(*args) once a slot is free."""
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await fn(*args)
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    async def map_as_completed(
+        self, fn: Callable[[Any], Awaitable[Any]], items: Iterable[Any]
+    ) -> AsyncIterator[Tuple[Any, Any, Optional[BaseException]]]:
+        """Yields (item, result, error) in completion order."""
+
+        async def run_one(item):
+            try:
+                return item, await self.run(fn, item), None
+            except Exception as e:
+                return item, None, e
+
+        tasks = [asyncio.ensure_future(run_one(item)) for item in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Client went away mid-stream: stop the remaining model calls
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {"max_in_flight": self.max_in_flight, "in_flight": self.in_flight, "waiting": self.waiting}
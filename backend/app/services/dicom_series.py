@@ -0,0 +1,326 @@
+import os
+import json
+import uuid
+import shutil
+import struct
+import asyncio
+import zipfile
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pydicom
+from pydicom.uid import ExplicitVRLittleEndian, ImplicitVRLittleEndian
+from PIL import Image
+from app.models.schemas import SeriesData, SeriesInstance
+from app.services.dicom_windowing import window_to_uint8
+from app.services.image_processor import THUMBNAIL_SIZE
+from app.services.worker_pool import WorkerPool
+
+# Configuration
+SERIES_DIR = os.environ.get("SERIES_DIR", "uploads/series")
+SERIES_MAX_FILES = int(os.environ.get("SERIES_MAX_FILES", "1000"))  # Files per multipart upload
+SERIES_MAX_SIZE = int(os.environ.get("SERIES_MAX_SIZE", str(1024 * 1024 * 1024)))  # 1GB per upload
+SERIES_MAX_UNCOMPRESSED = int(os.environ.get("SERIES_MAX_UNCOMPRESSED", str(4 * 1024 * 1024 * 1024)))  # Zip bomb guard
+
+# Transfer syntaxes whose pixel data sits in the file as a plain little-endian array
+MEMMAP_SYNTAXES = {ExplicitVRLittleEndian, ImplicitVRLittleEndian}
+LONG_LENGTH_VRS = {b"OB", b"OW", b"OF", b"OD", b"OL", b"OV", b"UN", b"UT", b"SQ", b"UC", b"UR"}
+PIXEL_DATA_TAG = b"\xe0\x7f\x10\x00"
+
+
+def _pixel_data_offset(fp, explicit_vr: bool) -> Optional[int]:
+    """
+    Returns the file offset of the PixelData value, given fp positioned at its tag
+    (where dcmread(stop_before_pixels=True) leaves it). None if it is encapsulated.
+    """
+    start = fp.tell()
+    header = fp.read(12)
+    if header[:4] != PIXEL_DATA_TAG:
+        return None
+    if explicit_vr:
+        if header[4:6] in LONG_LENGTH_VRS:
+            length, value_start = struct.unpack("<I", header[8:12])[0], start + 12
+        else:
+            length, value_start = struct.unpack("<H", header[6:8])[0], start + 8
+    else:
+        length, value_start = struct.unpack("<I", header[4:8])[0], start + 8
+    if length == 0xFFFFFFFF:
+        return None  # Undefined length means compressed fragments
+    return value_start
+
+
+def read_instance_header(path: str) -> Optional[dict]:
+    """Reads one file's header without touching its pixel data. None if it is not an image instance."""
+    try:
+        with open(path, "rb") as fp:
+            ds = pydicom.dcmread(fp, stop_before_pixels=True)
+            syntax = getattr(ds, "file_meta", {}).get("TransferSyntaxUID", ImplicitVRLittleEndian)
+            pixel_tag_position = fp.tell()
+            if fp.read(4) != PIXEL_DATA_TAG:
+                return None  # No pixel data, e.g. a DICOMDIR or structured report
+            offset = None
+            if syntax in MEMMAP_SYNTAXES:
+                fp.seek(pixel_tag_position)
+                offset = _pixel_data_offset(fp, explicit_vr=syntax == ExplicitVRLittleEndian)
+    except Exception:
+        return None
+
+    if not getattr(ds, "SeriesInstanceUID", None) or not getattr(ds, "Rows", None):
+        return None
+
+    instance_number = getattr(ds, "InstanceNumber", None)
+    return {
+        "sop_instance_uid": str(getattr(ds, "SOPInstanceUID", uuid.uuid4())),
+        "series_instance_uid": str(ds.SeriesInstanceUID),
+        "study_instance_uid": str(getattr(ds, "StudyInstanceUID", "")) or None,
+        "instance_number": int(instance_number) if instance_number not in (None, "") else None,
+        "modality": str(getattr(ds, "Modality", "Unknown")),
+        "body_part": str(getattr(ds, "BodyPartExamined", "")) or None,
+        "rows": int(ds.Rows),
+        "columns": int(ds.Columns),
+        "frames": int(getattr(ds, "NumberOfFrames", 1) or 1),
+        "pixel_offset": offset,
+        "path": path,
+    }
+
+
+def extract_zip(zip_path: str, dest_dir: str, max_bytes: int = SERIES_MAX_UNCOMPRESSED) -> List[str]:
+    """Extracts members under generated names (never the archive's paths) and enforces a size budget."""
+    os.makedirs(dest_dir, exist_ok=True)
+    paths = []
+    written = 0
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                written += info.file_size
+                if written > max_bytes:
+                    raise ValueError("Archive expands beyond the allowed size")
+                target = os.path.join(dest_dir, f"{uuid.uuid4().hex}.dcm")
+                with archive.open(info) as src, open(target, "wb") as dst:
+                    # file_size is attacker controlled, so the copy is capped independently
+                    remaining = info.file_size
+                    while True:
+                        chunk = src.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        remaining -= len(chunk)
+                        if remaining < 0:
+                            raise ValueError("Archive member larger than declared")
+                        dst.write(chunk)
+                paths.append(target)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Invalid zip archive: {str(e)}")
+    return paths
+
+
+def _frame_pixels(instance: dict, frame_index: int, ds) -> np.ndarray:
+    """Stored pixel values of one frame, memory-mapped when the file layout allows it."""
+    bits_allocated = int(getattr(ds, "BitsAllocated", 16))
+    bits_stored = int(getattr(ds, "BitsStored", bits_allocated))
+    signed = int(getattr(ds, "PixelRepresentation", 0)) == 1
+    samples = int(getattr(ds, "SamplesPerPixel", 1) or 1)
+
+    if instance["pixel_offset"] is not None and bits_allocated in (8, 16) and (bits_stored == bits_allocated or not signed):
+        dtype = np.dtype(f"<{'i' if signed else 'u'}{bits_allocated // 8}")
+        shape = (instance["rows"], instance["columns"]) + ((samples,) if samples > 1 else ())
+        frame_bytes = int(np.prod(shape)) * dtype.itemsize
+        frame = np.memmap(
+            instance["path"],
+            dtype=dtype,
+            mode="r",
+            offset=instance["pixel_offset"] + frame_index * frame_bytes,
+            shape=shape,
+        )
+        if bits_stored < bits_allocated:
+            # Unused high bits may hold overlay data; mask them off
+            return np.bitwise_and(frame, (1 << bits_stored) - 1)
+        return frame
+
+    # Compressed or unusual layouts: decode just the requested frame
+    try:
+        from pydicom.pixels import pixel_array
+        return pixel_array(instance["path"], index=frame_index)
+    except ImportError:
+        pixels = pydicom.dcmread(instance["path"]).pixel_array
+        return pixels[frame_index] if instance["frames"] > 1 else pixels
+
+
+def render_frame(instance: dict, frame_index: int, out_path: str, thumbnail: bool = False, preset: Optional[str] = None) -> str:
+    """Decodes, windows and encodes a single frame to PNG. Runs in the worker pool."""
+    if os.path.exists(out_path):
+        return out_path
+
+    ds = pydicom.dcmread(instance["path"], stop_before_pixels=True)
+    pixels = _frame_pixels(instance, frame_index, ds)
+    samples = int(getattr(ds, "SamplesPerPixel", 1) or 1)
+    if samples > 1 and pixels.dtype == np.uint8:
+        display = np.asarray(pixels)
+    else:
+        display, _ = window_to_uint8(pixels, ds, instance.get("modality", "Unknown"), preset)
+
+    image = Image.fromarray(display)
+    if thumbnail:
+        # reduce() subsamples before filtering, so big frames never get a full-size resample
+        factor = max(1, min(image.size[0] // THUMBNAIL_SIZE[0], image.size[1] // THUMBNAIL_SIZE[1]))
+        if factor > 1:
+            image = image.reduce(factor)
+        image.thumbnail(THUMBNAIL_SIZE)
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    image.save(tmp_path, "PNG")
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class SeriesStore:
+    """
+    Series-level DICOM ingest with lazy frame access.
+
+    Only headers are read at ingest. Instances are indexed by SeriesInstanceUID and
+    ordered by InstanceNumber, and each series keeps a JSON index next to its files.
+    Frames are decoded on demand, straight from a memory map of the stored file when
+    the transfer syntax allows, and rendered PNGs are kept on disk.
+    """
+
+    def __init__(self, series_dir: str = SERIES_DIR, pool: Optional[WorkerPool] = None):
+        self.series_dir = series_dir
+        self.pool = pool or WorkerPool()
+        self._series: Dict[str, SeriesData] = {}
+        os.makedirs(self.series_dir, exist_ok=True)
+
+    @staticmethod
+    def series_id_for(series_instance_uid: str) -> str:
+        # Deterministic, so re-uploading instances of a known series merges into it
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, series_instance_uid))
+
+    def _series_path(self, series_id: str) -> str:
+        return os.path.join(self.series_dir, series_id)
+
+    def _index_path(self, series_id: str) -> str:
+        return os.path.join(self._series_path(series_id), "index.json")
+
+    async def _map_bounded(self, fn, items: list) -> list:
+        """Fans work out over the pool without overrunning its queue."""
+        limit = asyncio.Semaphore(self.pool.max_workers)
+
+        async def run(item):
+            async with limit:
+                return await self.pool.run(fn, *item)
+
+        return await asyncio.gather(*(run(item) for item in items))
+
+    async def ingest(self, paths: List[str]) -> List[SeriesData]:
+        """Indexes DICOM files (or zips of them) and moves them into per-series storage."""
+        staging = os.path.join(self.series_dir, "staging", uuid.uuid4().hex)
+        try:
+            files = []
+            for path in paths:
+                if zipfile.is_zipfile(path):
+                    files.extend(await self.pool.run(extract_zip, path, staging))
+                else:
+                    files.append(path)
+
+            headers = [h for h in await self._map_bounded(read_instance_header, [(p,) for p in files]) if h]
+            if not headers:
+                raise ValueError("No DICOM image instances found in upload")
+
+            grouped: Dict[str, List[dict]] = {}
+            for header in headers:
+                grouped.setdefault(header["series_instance_uid"], []).append(header)
+
+            return [self._store_series(uid, members) for uid, members in grouped.items()]
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _store_series(self, series_instance_uid: str, headers: List[dict]) -> SeriesData:
+        series_id = self.series_id_for(series_instance_uid)
+        series_path = self._series_path(series_id)
+        os.makedirs(series_path, exist_ok=True)
+
+        existing = self.get(series_id)
+        instances = {i.sop_instance_uid: i for i in existing.instances} if existing else {}
+        for header in headers:
+            target = os.path.join(series_path, f"{uuid.uuid5(uuid.NAMESPACE_OID, header['sop_instance_uid']).hex}.dcm")
+            shutil.move(header["path"], target)
+            instances[header["sop_instance_uid"]] = SeriesInstance(
+                sop_instance_uid=header["sop_instance_uid"],
+                instance_number=header["instance_number"],
+                file_path=target,
+                frames=header["frames"],
+                rows=header["rows"],
+                columns=header["columns"],
+                pixel_offset=header["pixel_offset"],
+            )
+
+        ordered = sorted(
+            instances.values(),
+            key=lambda i: (i.instance_number is None, i.instance_number or 0, i.sop_instance_uid),
+        )
+        first = headers[0]
+        series = SeriesData(
+            series_id=series_id,
+            series_instance_uid=series_instance_uid,
+            study_instance_uid=first["study_instance_uid"],
+            modality=first["modality"],
+            body_part=first["body_part"],
+            frame_count=sum(i.frames for i in ordered),
+            instances=ordered,
+        )
+
+        tmp_path = f"{self._index_path(series_id)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(series.model_dump_json() if hasattr(series, "model_dump_json") else series.json())
+        os.replace(tmp_path, self._index_path(series_id))
+        self._series[series_id] = series
+        return series
+
+    def get(self, series_id: str) -> Optional[SeriesData]:
+        if series_id in self._series:
+            return self._series[series_id]
+        try:
+            with open(self._index_path(series_id), "r", encoding="utf-8") as f:
+                series = SeriesData(**json.load(f))
+        except (OSError, ValueError):
+            return None
+        self._series[series_id] = series
+        return series
+
+    def locate_frame(self, series: SeriesData, frame_index: int) -> Tuple[SeriesInstance, int]:
+        """Maps a series-wide frame index onto (instance, frame within instance)."""
+        if frame_index < 0:
+            raise IndexError(frame_index)
+        for instance in series.instances:
+            if frame_index < instance.frames:
+                return instance, frame_index
+            frame_index -= instance.frames
+        raise IndexError(frame_index)
+
+    def _worker_args(self, series: SeriesData, frame_index: int, thumbnail: bool) -> tuple:
+        instance, local_index = self.locate_frame(series, frame_index)
+        suffix = "_thumb" if thumbnail else ""
+        out_path = os.path.join(self._series_path(series.series_id), "frames", f"{frame_index}{suffix}.png")
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        header = {
+            "path": instance.file_path,
+            "rows": instance.rows,
+            "columns": instance.columns,
+            "frames": instance.frames,
+            "pixel_offset": instance.pixel_offset,
+            "modality": series.modality,
+        }
+        return (header, local_index, out_path, thumbnail)
+
+    async def render_frame(self, series: SeriesData, frame_index: int, thumbnail: bool = False) -> str:
+        """Returns the PNG path for one frame, decoding it on first request."""
+        args = self._worker_args(series, frame_index, thumbnail)
+        if os.path.exists(args[2]):
+            return args[2]
+        return await self.pool.run(render_frame, *args)
+
+    async def render_thumbnails(self, series: SeriesData) -> List[str]:
+        """Decodes every frame's thumbnail in parallel across the pool."""
+        jobs = [self._worker_args(series, i, True) for i in range(series.frame_count)]
+        pending = [job for job in jobs if not os.path.exists(job[2])]
+        await self._map_bounded(render_frame, pending)
+        return [job[2] for job in jobs]
@@ -0,0 +1,216 @@
+import os
+from typing import Optional, Tuple
+import numpy as np
+
+# Configuration
+ROWS_PER_BLOCK = 256  # LUT is applied in row blocks so index conversion never spans the whole frame
+
+# Named VOI windows as (center, width) in modality units (HU for CT)
+WINDOW_PRESETS = {
+    "CT": {
+        "soft_tissue": (40.0, 400.0),
+        "lung": (-600.0, 1500.0),
+        "bone": (400.0, 1800.0),
+        "brain": (40.0, 80.0),
+        "liver": (60.0, 160.0),
+        "mediastinum": (50.0, 350.0),
+    },
+    "MG": {
+        "breast": (2048.0, 4096.0),
+    },
+}
+
+# Preset used when a file carries no window of its own, per modality
+DEFAULT_PRESETS = {
+    "CT": os.environ.get("DICOM_CT_PRESET", "soft_tissue"),
+}
+
+
+def _first(value) -> Optional[float]:
+    """WindowCenter/WindowWidth may be multi-valued; the first pair is the default."""
+    if value is None:
+        return None
+    if not isinstance(value, (str, bytes, int, float)):
+        try:
+            value = value[0]
+        except (TypeError, IndexError):
+            return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _stored_domain(dtype: np.dtype) -> Optional[np.ndarray]:
+    """Every stored value a small integer dtype can hold, in LUT index order, as float32."""
+    if dtype == np.uint8:
+        return np.arange(256, dtype=np.float32)
+    if dtype == np.int8:
+        return np.arange(256, dtype=np.uint8).view(np.int8).astype(np.float32)
+    if dtype == np.uint16:
+        return np.arange(65536, dtype=np.float32)
+    if dtype == np.int16:
+        # Indexing goes through a uint16 view, so entry i holds the signed value with that bit pattern
+        return np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.float32)
+    return None
+
+
+def _index_view(pixels: np.ndarray) -> np.ndarray:
+    """Reinterprets signed pixels as unsigned LUT indices without copying."""
+    if pixels.dtype == np.int16:
+        return pixels.view(np.uint16)
+    if pixels.dtype == np.int8:
+        return pixels.view(np.uint8)
+    return pixels
+
+
+def apply_linear_window(values: np.ndarray, center: float, width: float, function: str = "LINEAR") -> np.ndarray:
+    """
+    DICOM PS3.3 C.11.2.1.2 VOI window, mapping modality values to 0-255 in place.
+    values must be a float32 array; it is overwritten and returned.
+    """
+    if function == "SIGMOID":
+        np.subtract(values, center, out=values)
+        np.multiply(values, -4.0 / max(width, 1.0), out=values)
+        np.exp(values, out=values)
+        np.add(values, 1.0, out=values)
+        np.divide(255.0, values, out=values)
+        return values
+
+    if function == "LINEAR_EXACT":
+        low, span = center - width / 2.0, max(width, 1e-6)
+    else:
+        width = max(width, 1.0)
+        low, span = center - 0.5 - (width - 1.0) / 2.0, max(width - 1.0, 1e-6)
+
+    np.subtract(values, low, out=values)
+    np.multiply(values, 255.0 / span, out=values)
+    np.clip(values, 0.0, 255.0, out=values)
+    return values
+
+
+def _apply_voi_lut_sequence(values: np.ndarray, item) -> np.ndarray:
+    """Applies a VOI LUT Sequence item (LUTDescriptor + LUTData) to modality values."""
+    entries, first_mapped, bits = [int(v) for v in item.LUTDescriptor]
+    entries = entries or 65536
+    lut_data = np.asarray(item.LUTData, dtype=np.float32)[:entries]
+    indices = np.clip(values - first_mapped, 0, len(lut_data) - 1).astype(np.int32)
+    out = lut_data[indices]
+    np.multiply(out, 255.0 / float((1 << bits) - 1), out=out)
+    return out
+
+
+class WindowSettings:
+    """The VOI transform chosen for one dataset."""
+
+    def __init__(self, center: Optional[float], width: Optional[float], function: str = "LINEAR", source: str = "data_range", voi_lut=None):
+        self.center = center
+        self.width = width
+        self.function = function
+        self.source = source
+        self.voi_lut = voi_lut
+
+    def as_dict(self) -> dict:
+        return {"center": self.center, "width": self.width, "function": self.function, "source": self.source}
+
+
+def select_window(dataset, modality: str, preset: Optional[str] = None) -> WindowSettings:
+    """
+    Picks the VOI transform: an explicit preset, then the file's VOI LUT or window,
+    then the modality default preset. Returns center/width None to fall back to the data range.
+    """
+    presets = WINDOW_PRESETS.get(modality, {})
+    if preset and preset in presets:
+        center, width = presets[preset]
+        return WindowSettings(center, width, source=f"preset:{preset}")
+
+    voi_sequence = getattr(dataset, "VOILUTSequence", None)
+    if voi_sequence:
+        return WindowSettings(None, None, source="voi_lut_sequence", voi_lut=voi_sequence[0])
+
+    center = _first(getattr(dataset, "WindowCenter", None))
+    width = _first(getattr(dataset, "WindowWidth", None))
+    if center is not None and width:
+        function = str(getattr(dataset, "VOILUTFunction", "LINEAR") or "LINEAR").upper()
+        return WindowSettings(center, width, function=function, source="dicom")
+
+    default = DEFAULT_PRESETS.get(modality)
+    if default and default in presets:
+        center, width = presets[default]
+        return WindowSettings(center, width, source=f"preset:{default}")
+
+    return WindowSettings(None, None)
+
+
+def build_lut(domain: np.ndarray, slope: float, intercept: float, window: WindowSettings, invert: bool) -> np.ndarray:
+    """Folds rescale, VOI and MONOCHROME1 inversion into a single uint8 lookup table."""
+    values = domain.copy()
+    if slope != 1.0:
+        np.multiply(values, slope, out=values)
+    if intercept != 0.0:
+        np.add(values, intercept, out=values)
+
+    if window.voi_lut is not None:
+        values = _apply_voi_lut_sequence(values, window.voi_lut)
+    else:
+        apply_linear_window(values, window.center, window.width, window.function)
+
+    lut = np.rint(values).astype(np.uint8)
+    if invert:
+        np.subtract(255, lut, out=lut)
+    return lut
+
+
+def window_to_uint8(
+    pixels: np.ndarray,
+    dataset,
+    modality: str = "Unknown",
+    preset: Optional[str] = None,
+) -> Tuple[np.ndarray, WindowSettings]:
+    """
+    Converts stored DICOM pixel values to display-ready uint8.
+
+    8/16-bit data goes through a precomputed 256/65536-entry LUT applied block by
+    block, so no float copy of the frame is ever made. Other dtypes fall back to
+    per-block float32 arithmetic.
+    """
+    slope = float(getattr(dataset, "RescaleSlope", 1.0) or 1.0)
+    intercept = float(getattr(dataset, "RescaleIntercept", 0.0) or 0.0)
+    invert = str(getattr(dataset, "PhotometricInterpretation", "")).upper() == "MONOCHROME1"
+    window = select_window(dataset, modality, preset)
+
+    if window.voi_lut is None and (window.center is None or not window.width):
+        # No window anywhere: stretch the stored range, one min and one max pass
+        low, high = float(pixels.min()), float(pixels.max())
+        low, high = sorted((low * slope + intercept, high * slope + intercept))
+        window = WindowSettings((low + high) / 2.0 + 0.5, max(high - low + 1.0, 1.0), function="LINEAR", source="data_range")
+
+    out = np.empty(pixels.shape, dtype=np.uint8)
+    domain = _stored_domain(pixels.dtype)
+
+    if domain is not None:
+        lut = build_lut(domain, slope, intercept, window, invert)
+        indices = _index_view(pixels)
+        for start in range(0, pixels.shape[0], ROWS_PER_BLOCK):
+            block = slice(start, start + ROWS_PER_BLOCK)
+            # Every index is inside the LUT, so "clip" only skips numpy's buffered bounds check
+            np.take(lut, indices[block], out=out[block], mode="clip")
+        return out, window
+
+    # Wide or float data: same transform computed per block in float32
+    for start in range(0, pixels.shape[0], ROWS_PER_BLOCK):
+        block = slice(start, start + ROWS_PER_BLOCK)
+        values = pixels[block].astype(np.float32)
+        if slope != 1.0:
+            np.multiply(values, slope, out=values)
+        if intercept != 0.0:
+            np.add(values, intercept, out=values)
+        if window.voi_lut is not None:
+            values = _apply_voi_lut_sequence(values, window.voi_lut)
+        else:
+            apply_linear_window(values, window.center, window.width, window.function)
+        np.rint(values, out=values)
+        if invert:
+            np.subtract(255.0, values, out=values)
+        out[block] = values
+    return out, window
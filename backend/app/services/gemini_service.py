@@ -10,13 +10,22 @@ GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 if GOOGLE_API_KEY:
     genai.configure(api_key=GOOGLE_API_KEY)
 
+# Bump whenever the prompt text changes so cached analyses are not reused
+PROMPT_VERSION = "1"
+
 class GeminiService:
     def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp') # Using experimental flash model as requested, fallbacks might be needed
-        self.generation_config = genai.types.GenerationConfig(
-            temperature=0.4,
-            response_mime_type="application/json"
-        )
+        self.model_name = 'gemini-2.0-flash-exp' # Using experimental flash model as requested, fallbacks might be needed
+        self.model = genai.GenerativeModel(self.model_name)
+        self.generation_params = {
+            "temperature": 0.4,
+            "response_mime_type": "application/json"
+        }
+        self.generation_config = genai.types.GenerationConfig(**self.generation_params)
+
+    def cache_fingerprint(self) -> dict:
+        """Model settings that affect the analysis output, used in cache keys."""
+        return {"model": self.model_name, **self.generation_params}
 
     async def analyze_medical_image(self, image_path: str, image_type: str, retries=3):
         """
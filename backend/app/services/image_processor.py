@@ -2,8 +2,11 @@ import os
 import io
 import uuid
 import base64
-from typing import Tuple, Optional
+import hashlib
+from typing import Tuple, Optional, Union
 from app.models.schemas import ImageData, ImageMetadata
+from app.services.worker_pool import WorkerPool
+from app.services.dicom_windowing import window_to_uint8
 import pydicom
 from PIL import Image, ImageEnhance
 import numpy as np
@@ -15,10 +18,20 @@ MAX_RESOLUTION = (2048, 2048)
 THUMBNAIL_SIZE = (256, 256)
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".dcm"}
 
+def _as_file(source: Union[bytes, str]):
+    """Wraps upload bytes without copying; paths are handed to the decoders as-is."""
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+
+def _run_pipeline(upload_dir: str, thumbnail_dir: str, file_content: Union[bytes, str], filename: str, image_id: str) -> ImageData:
+    """Pool entry point. Module level so it can be pickled into worker processes."""
+    return ImageProcessor(upload_dir, thumbnail_dir).process(file_content, filename, image_id)
+
 class ImageProcessor:
-    def __init__(self, upload_dir: str = "uploads", thumbnail_dir: str = "uploads/thumbnails"):
+    def __init__(self, upload_dir: str = "uploads", thumbnail_dir: str = "uploads/thumbnails", pool: Optional[WorkerPool] = None, window_preset: Optional[str] = None):
         self.upload_dir = upload_dir
         self.thumbnail_dir = thumbnail_dir
+        self._pool = pool
+        self.window_preset = window_preset # e.g. "lung" to override the file's own CT window
         os.makedirs(self.upload_dir, exist_ok=True)
         os.makedirs(self.thumbnail_dir, exist_ok=True)
 
@@ -31,10 +44,10 @@ class ImageProcessor:
         if ext not in ALLOWED_EXTENSIONS:
             raise ValueError(f"Unsupported file format: {ext}")
 
-    def process_dicom(self, file_content: bytes) -> Tuple[Image.Image, dict]:
-        """Converts DICOM bytes to PIL Image and extracts metadata."""
+    def process_dicom(self, file_content: Union[bytes, str]) -> Tuple[Image.Image, dict]:
+        """Converts DICOM bytes (or a path to a DICOM file) to PIL Image and extracts metadata."""
         try:
-            dicom_data = pydicom.dcmread(io.BytesIO(file_content))
+            dicom_data = pydicom.dcmread(_as_file(file_content))
             
             # Extract basic metadata
             metadata = {
@@ -43,14 +56,18 @@ class ImageProcessor:
                 "patient_id": "ANONYMIZED" # Anonymize immediately
             }
 
-            # Normalize pixel array
+            # Rescale slope/intercept, VOI window and MONOCHROME1 inversion in one LUT pass
             pixel_array = dicom_data.pixel_array
-            
-            # Simple normalization to 0-255
-            if pixel_array.max() > pixel_array.min():
-                pixel_array = (pixel_array - pixel_array.min()) / (pixel_array.max() - pixel_array.min()) * 255.0
-            
-            pixel_array = pixel_array.astype(np.uint8)
+            samples = int(getattr(dicom_data, "SamplesPerPixel", 1) or 1)
+            if pixel_array.ndim == (3 if samples > 1 else 2) + 1:
+                pixel_array = pixel_array[0] # Multi-frame: first frame is the representative image
+
+            if samples > 1 and pixel_array.dtype == np.uint8:
+                pass # Colour data is already display-ready
+            else:
+                pixel_array, window = window_to_uint8(pixel_array, dicom_data, metadata["modality"], self.window_preset)
+                metadata["window"] = window.as_dict()
+
             image = Image.fromarray(pixel_array)
             return image, metadata
         except Exception as e:
@@ -79,6 +96,13 @@ class ImageProcessor:
         thumb.save(thumb_path, "PNG")
         return thumb_path
 
+    def compute_content_hash(self, image: Image.Image) -> str:
+        """Hashes decoded pixel data so identical studies match regardless of upload id."""
+        digest = hashlib.sha256()
+        digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode("ascii"))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
     def prepare_for_gemini(self, image: Image.Image) -> str:
         """Converts image to base64 for Gemini (if not passing file path/bytes directly)."""
         # Resize if too large
@@ -89,11 +113,36 @@ class ImageProcessor:
         image.save(buffered, format="PNG")
         return base64.b64encode(buffered.getvalue()).decode("utf-8")
 
+    @property
+    def pool(self) -> WorkerPool:
+        # Created on first use; worker processes rebuild ImageProcessor and never need one
+        if self._pool is None:
+            self._pool = WorkerPool()
+        return self._pool
+
     async def save_and_process(self, file_content: bytes, filename: str) -> ImageData:
-        """Main processing pipeline."""
+        """Main processing pipeline. Decode, enhance and encode run in the worker pool."""
         self.validate_image(file_content, filename)
-        
+
         image_id = str(uuid.uuid4())
+        # Raises PoolBusyError when the queue is full
+        return await self.pool.run(_run_pipeline, self.upload_dir, self.thumbnail_dir, file_content, filename, image_id)
+
+    async def save_and_process_file(self, path: str, filename: str, sha256: Optional[str] = None) -> ImageData:
+        """Same pipeline for an upload already spooled to disk; workers read the file themselves."""
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            raise ValueError(f"Unsupported file format: {ext}")
+        if os.path.getsize(path) > MAX_FILE_SIZE:
+            raise ValueError(f"File size exceeds limit of {MAX_FILE_SIZE / (1024*1024)}MB")
+
+        image_id = str(uuid.uuid4())
+        image_data = await self.pool.run(_run_pipeline, self.upload_dir, self.thumbnail_dir, path, filename, image_id)
+        image_data.upload_sha256 = sha256
+        return image_data
+
+    def process(self, file_content: Union[bytes, str], filename: str, image_id: str) -> ImageData:
+        """Synchronous, CPU-bound part of the pipeline."""
         ext = os.path.splitext(filename)[1].lower()
         
         image = None
@@ -104,7 +153,7 @@ class ImageProcessor:
             image, dicom_metadata = self.process_dicom(file_content)
         else:
             try:
-                image = Image.open(io.BytesIO(file_content))
+                image = Image.open(_as_file(file_content))
                 # Validate resolution
                 if image.size[0] < MIN_RESOLUTION[0] or image.size[1] < MIN_RESOLUTION[1]:
                      # Warn or Reject? Prompt says "Resolution check (minimum 512x512)"
@@ -150,5 +199,6 @@ class ImageProcessor:
             image_id=image_id,
             file_path=processed_path,
             metadata=metadata,
-            thumbnail_path=thumbnail_path
+            thumbnail_path=thumbnail_path,
+            content_hash=self.compute_content_hash(image)
         )
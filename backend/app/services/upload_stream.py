@@ -0,0 +1,243 @@
+import os
+import hashlib
+import tempfile
+from typing import List, Optional
+from starlette.requests import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # Older python-multipart releases
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from app.services.image_processor import MAX_FILE_SIZE, ALLOWED_EXTENSIONS
+
+# Configuration
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR", "uploads/spool")
+MULTIPART_OVERHEAD = 64 * 1024  # Allowance for boundaries and part headers in Content-Length checks
+SNIFF_BYTES = 132  # DICOM puts "DICM" after a 128 byte preamble
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SIGNATURE = b"\xff\xd8\xff"
+ZIP_SIGNATURE = b"PK\x03\x04"
+
+RASTER_FORMATS = {".png", ".jpg"}
+
+
+class UploadTooLargeError(ValueError):
+    """Raised as soon as an upload crosses the size limit."""
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Returns the file extension matching the magic bytes, or None."""
+    if head.startswith(PNG_SIGNATURE):
+        return ".png"
+    if head.startswith(JPEG_SIGNATURE):
+        return ".jpg"
+    if head.startswith(ZIP_SIGNATURE):
+        return ".zip"
+    if len(head) >= SNIFF_BYTES and head[128:132] == b"DICM":
+        return ".dcm"
+    return None
+
+
+def _formats_compatible(detected: str, ext: str) -> bool:
+    ext = ".jpg" if ext == ".jpeg" else ext
+    # PIL decodes either raster format whatever the extension says
+    return detected == ext or (detected in RASTER_FORMATS and ext in RASTER_FORMATS)
+
+
+class SpooledUpload:
+    """An uploaded file written to disk, with its size and SHA-256."""
+
+    def __init__(self, path: str, filename: str, size: int, sha256: str, detected_format: str):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.detected_format = detected_format
+
+    def cleanup(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StreamingUploadParser:
+    """
+    Parses a multipart upload chunk by chunk straight from the request stream.
+
+    File parts are written to spool files as they arrive, so memory use per
+    upload stays at one chunk. The size caps and the magic-byte check are applied
+    incrementally and abort the transfer the moment they fail, and the SHA-256
+    is computed on the fly.
+    """
+
+    def __init__(
+        self,
+        field_name: str = "file",
+        max_size: int = MAX_FILE_SIZE,
+        spool_dir: str = UPLOAD_SPOOL_DIR,
+        allowed_extensions=ALLOWED_EXTENSIONS,
+        max_files: int = 1,
+        max_total_size: Optional[int] = None,
+    ):
+        self.field_name = field_name
+        self.max_size = max_size
+        self.spool_dir = spool_dir
+        self.allowed_extensions = set(allowed_extensions)
+        self.max_files = max_files
+        self.max_total_size = max_total_size or max_size * max_files
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    async def parse(self, request: Request) -> SpooledUpload:
+        """Parses a request carrying a single file."""
+        return (await self.parse_many(request))[0]
+
+    async def parse_many(self, request: Request) -> List[SpooledUpload]:
+        """Parses every file part sent under field_name, up to max_files."""
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise ValueError("Expected a multipart/form-data upload")
+
+        # Reject before reading a single byte when the client declares the size
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_total_size + MULTIPART_OVERHEAD * self.max_files:
+            raise UploadTooLargeError(self._too_large_message(self.max_total_size))
+
+        state = _PartState(self)
+        parser = MultipartParser(params[b"boundary"], state.callbacks())
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+            parser.finalize()
+            return state.result()
+        except BaseException:
+            state.discard()
+            raise
+
+    def _too_large_message(self, limit: int) -> str:
+        return f"File size exceeds limit of {limit / (1024*1024)}MB"
+
+
+class _PartState:
+    """Callback state for one multipart request."""
+
+    def __init__(self, owner: StreamingUploadParser):
+        self.owner = owner
+        self.header_field = b""
+        self.header_value = b""
+        self.headers = {}
+        self.in_file = False
+        self.file = None
+        self.filename = None
+        self.size = 0
+        self.total_size = 0
+        self.head = b""
+        self.detected_format = None
+        self.digest = None
+        self.uploads: List[SpooledUpload] = []
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self) -> None:
+        self.headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self.header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        self.in_file = name == self.owner.field_name and filename is not None
+        if not self.in_file:
+            return
+
+        if len(self.uploads) >= self.owner.max_files:
+            raise ValueError(f"Too many files, at most {self.owner.max_files} per upload")
+
+        self.filename = os.path.basename(filename.decode("utf-8", "replace"))
+        ext = os.path.splitext(self.filename)[1].lower()
+        if ext not in self.owner.allowed_extensions:
+            raise ValueError(f"Unsupported file format: {ext}")
+
+        self.size = 0
+        self.head = b""
+        self.detected_format = None
+        self.digest = hashlib.sha256()
+        self.file = tempfile.NamedTemporaryFile(dir=self.owner.spool_dir, suffix=".upload", delete=False)
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self.in_file:
+            return
+        chunk = data[start:end]
+        self.size += len(chunk)
+        self.total_size += len(chunk)
+        if self.size > self.owner.max_size:
+            raise UploadTooLargeError(self.owner._too_large_message(self.owner.max_size))
+        if self.total_size > self.owner.max_total_size:
+            raise UploadTooLargeError(self.owner._too_large_message(self.owner.max_total_size))
+
+        if self.detected_format is None:
+            self.head += chunk[:SNIFF_BYTES]
+            self._sniff(final=False)
+
+        self.digest.update(chunk)
+        # Writes land in the page cache; a 64KB write is cheaper than a thread hop
+        self.file.write(chunk)
+
+    def on_part_end(self) -> None:
+        if self.in_file:
+            if self.detected_format is None:
+                self._sniff(final=True)
+            self.file.close()
+            self.uploads.append(SpooledUpload(
+                path=self.file.name,
+                filename=self.filename,
+                size=self.size,
+                sha256=self.digest.hexdigest(),
+                detected_format=self.detected_format,
+            ))
+            self.file = None
+        self.in_file = False
+
+    def _sniff(self, final: bool) -> None:
+        ext = os.path.splitext(self.filename)[1].lower()
+        fmt = sniff_format(self.head)
+        if len(self.head) < SNIFF_BYTES and not final and fmt is None:
+            # PNG, JPEG and ZIP are decidable early, DICOM needs the full preamble
+            return
+
+        if fmt is None:
+            raise ValueError("File content does not match a supported format")
+        if not _formats_compatible(fmt, ext):
+            raise ValueError(f"File content does not match extension {ext}")
+        self.detected_format = fmt
+
+    def result(self) -> List[SpooledUpload]:
+        if not self.uploads:
+            raise ValueError(f"Missing file field '{self.owner.field_name}'")
+        return self.uploads
+
+    def discard(self) -> None:
+        if self.file is not None:
+            self.file.close()
+        for path in [upload.path for upload in self.uploads] + ([self.file.name] if self.file is not None else []):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,89 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Configuration
+# "inline" runs on the event loop (debugging only), "thread" uses a thread pool,
+# "process" uses a process pool so CPU-bound work never holds the GIL of the server.
+IMAGE_PIPELINE_MODE = os.environ.get("IMAGE_PIPELINE_MODE", "thread")
+IMAGE_PIPELINE_WORKERS = int(os.environ.get("IMAGE_PIPELINE_WORKERS", str(os.cpu_count() or 2)))
+IMAGE_PIPELINE_MAX_QUEUE = int(os.environ.get("IMAGE_PIPELINE_MAX_QUEUE", "16"))  # Jobs waiting beyond busy workers
+
+POOL_MODES = {"inline", "thread", "process"}
+
+
+class PoolBusyError(Exception):
+    """Raised when a pool already has its maximum number of queued jobs."""
+
+
+class WorkerPool:
+    """
+    Runs blocking functions off the event loop with a bounded queue.
+
+    At most max_workers jobs run at once and at most max_queue more may wait;
+    anything beyond that is rejected with PoolBusyError so callers can apply
+    backpressure (HTTP 429) instead of building an unbounded backlog.
+    """
+
+    def __init__(
+        self,
+        mode: str = IMAGE_PIPELINE_MODE,
+        max_workers: int = IMAGE_PIPELINE_WORKERS,
+        max_queue: int = IMAGE_PIPELINE_MAX_QUEUE,
+    ):
+        if mode not in POOL_MODES:
+            raise ValueError(f"Unknown pool mode: {mode}")
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        """Jobs currently running or waiting."""
+        return self._pending
+
+    def _get_executor(self) -> Executor:
+        # Created lazily so importing the app does not fork workers
+        with self._executor_lock:
+            if self._executor is None:
+                if self.mode == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Runs fn(*args) in the pool. Arguments must be picklable in process mode."""
+        if self._pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise PoolBusyError("Processing queue is full, retry shortly")
+
+        self._pending += 1
+        try:
+            if self.mode == "inline":
+                return fn(*args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
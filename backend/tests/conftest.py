@@ -3,6 +3,9 @@ import pytest_asyncio
 from httpx import AsyncClient
 from app.main import app
 from unittest.mock import MagicMock
+import numpy as np
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
 import sys
 import os
 
@@ -34,3 +37,30 @@ def mock_gemini_response():
     }
     """
     return mock
+
+@pytest.fixture
+def make_dataset():
+    """Factory for minimal uncompressed DICOM datasets around a pixel array."""
+    def factory(pixels: np.ndarray, frames: int = 1, **attributes) -> Dataset:
+        ds = Dataset()
+        ds.file_meta = FileMetaDataset()
+        ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds.file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+        ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+        ds.SOPClassUID = ds.file_meta.MediaStorageSOPClassUID
+        ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID
+        ds.Modality = "CT"
+        ds.Rows, ds.Columns = pixels.shape[-2:]
+        if frames > 1:
+            ds.NumberOfFrames = frames
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.BitsAllocated = pixels.dtype.itemsize * 8
+        ds.BitsStored = ds.BitsAllocated
+        ds.HighBit = ds.BitsAllocated - 1
+        ds.PixelRepresentation = 1 if pixels.dtype.kind == "i" else 0
+        ds.PixelData = pixels.tobytes()
+        for key, value in attributes.items():
+            setattr(ds, key, value)
+        return ds
+    return factory
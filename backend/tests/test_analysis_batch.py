@@ -0,0 +1,51 @@
+import json
+import asyncio
+import pytest
+from httpx import AsyncClient
+from app.routers import medical_imaging
+from app.models.schemas import ImageData, ImageMetadata
+from app.services.analysis_scheduler import AnalysisScheduler
+
+
+@pytest.fixture
+def stored_images(monkeypatch):
+    images = {}
+    for name in ("a", "b", "c", "broken"):
+        images[name] = ImageData(
+            image_id=name,
+            file_path=f"{name}.png",
+            metadata=ImageMetadata(modality="CR", width=64, height=64, format="PNG"),
+        )
+    monkeypatch.setattr(medical_imaging, "image_metadata_store", images)
+    monkeypatch.setattr(medical_imaging, "analysis_results", {})
+    monkeypatch.setattr(medical_imaging, "analysis_scheduler", AnalysisScheduler(max_in_flight=2))
+    return images
+
+
+@pytest.mark.asyncio
+async def test_batch_streams_results_and_isolates_failures(async_client: AsyncClient, stored_images, monkeypatch):
+    peak = {"current": 0, "max": 0}
+
+    async def fake_analyze(image_path, image_type, retries=3):
+        peak["current"] += 1
+        peak["max"] = max(peak["max"], peak["current"])
+        await asyncio.sleep(0.01)
+        peak["current"] -= 1
+        if image_path.startswith("broken"):
+            return {"error": "model unavailable"}
+        return {"differential_diagnosis": [{"condition": "Normal", "probability": "90%"}]}
+
+    monkeypatch.setattr(medical_imaging.gemini_service, "analyze_medical_image", fake_analyze)
+
+    response = await async_client.post("/api/analyze-batch", json={"image_ids": ["a", "b", "broken", "c", "missing", "a"]})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    items = {line["image_id"]: line for line in lines[:-1]}
+    assert items["a"]["status"] == "done"
+    assert items["a"]["result"]["confidence"] == pytest.approx(0.9)
+    assert items["broken"]["status_code"] == 500
+    assert items["missing"]["status_code"] == 404
+    assert lines[-1]["summary"] == {"total": 5, "succeeded": 3, "failed": 2}
+    assert peak["max"] <= 2
@@ -0,0 +1,35 @@
+from app.services.analysis_cache import AnalysisCache
+
+
+def test_key_depends_on_content_and_settings():
+    config = {"model": "gemini", "temperature": 0.4}
+    key = AnalysisCache.make_key("abc", "CT", "1", config)
+    assert key == AnalysisCache.make_key("abc", "CT", "1", dict(config))
+    assert key != AnalysisCache.make_key("abd", "CT", "1", config)
+    assert key != AnalysisCache.make_key("abc", "MR", "1", config)
+    assert key != AnalysisCache.make_key("abc", "CT", "2", config)
+    assert key != AnalysisCache.make_key("abc", "CT", "1", {**config, "temperature": 0.5})
+
+
+def test_lru_eviction_and_counters(tmp_path):
+    cache = AnalysisCache(max_entries=2, cache_dir=None)
+    cache.put("a", {"diagnosis": "A"})
+    cache.put("b", {"diagnosis": "B"})
+    assert cache.get("a") == {"diagnosis": "A"}
+    cache.put("c", {"diagnosis": "C"})  # Evicts "b", the least recently used
+
+    assert cache.get("b") is None
+    assert cache.get("c") == {"diagnosis": "C"}
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    first = AnalysisCache(max_entries=4, cache_dir=str(tmp_path))
+    first.put("key", {"findings": ["Clear"]})
+
+    second = AnalysisCache(max_entries=4, cache_dir=str(tmp_path))
+    assert second.get("key") == {"findings": ["Clear"]}
+    assert second.stats()["disk_hits"] == 1
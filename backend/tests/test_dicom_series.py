@@ -0,0 +1,69 @@
+import io
+import zipfile
+import numpy as np
+import pytest
+from httpx import AsyncClient
+from PIL import Image
+from app.routers import medical_imaging
+from app.services.dicom_series import SeriesStore
+from app.services.worker_pool import WorkerPool
+
+
+def dicom_bytes(ds) -> bytes:
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def series_files(make_dataset):
+    series_uid = "1.2.3.4.5"
+    multi = np.stack([np.full((80, 80), v, dtype=np.uint16) for v in (100, 200, 300)])
+    later = make_dataset(multi, frames=3, SeriesInstanceUID=series_uid, InstanceNumber=2)
+    first = make_dataset(np.arange(80 * 80, dtype=np.uint16).reshape(80, 80), SeriesInstanceUID=series_uid, InstanceNumber=1)
+    return series_uid, dicom_bytes(later), dicom_bytes(first)
+
+
+@pytest.fixture(autouse=True)
+def isolated_series_store(tmp_path, monkeypatch):
+    store = SeriesStore(series_dir=str(tmp_path / "series"), pool=WorkerPool(mode="thread", max_workers=2))
+    monkeypatch.setattr(medical_imaging, "series_store", store)
+    monkeypatch.setattr(medical_imaging.series_upload_parser, "spool_dir", str(tmp_path))
+    return store
+
+
+@pytest.mark.asyncio
+async def test_zip_upload_is_indexed_by_instance_number(async_client: AsyncClient, series_files):
+    series_uid, later, first = series_files
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("b/IM2", later)
+        zf.writestr("a/IM1", first)
+        zf.writestr("README.txt", b"not dicom")
+
+    response = await async_client.post("/api/upload-series", files={"files": ("study.zip", archive.getvalue(), "application/zip")})
+
+    assert response.status_code == 200
+    [series] = response.json()
+    assert series["series_instance_uid"] == series_uid
+    assert series["frame_count"] == 4
+    assert [i["instance_number"] for i in series["instances"]] == [1, 2]
+    assert all(i["pixel_offset"] for i in series["instances"])
+
+
+@pytest.mark.asyncio
+async def test_frames_decode_lazily_from_memory_map(async_client: AsyncClient, series_files, isolated_series_store):
+    _, later, first = series_files
+    files = [("files", ("2.dcm", later, "application/dicom")), ("files", ("1.dcm", first, "application/dicom"))]
+    [series] = (await async_client.post("/api/upload-series", files=files)).json()
+
+    response = await async_client.get(f"/api/series/{series['series_id']}/frames/2")
+    assert response.status_code == 200
+    frame = np.asarray(Image.open(io.BytesIO(response.content)))
+    assert frame.shape == (80, 80)
+
+    thumbnails = (await async_client.post(f"/api/series/{series['series_id']}/thumbnails")).json()["thumbnails"]
+    assert len(thumbnails) == 4
+
+    missing = await async_client.get(f"/api/series/{series['series_id']}/frames/9")
+    assert missing.status_code == 404
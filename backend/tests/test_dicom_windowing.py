@@ -0,0 +1,42 @@
+import io
+import numpy as np
+from app.services.dicom_windowing import window_to_uint8
+from app.services.image_processor import ImageProcessor
+
+
+def test_ct_window_matches_float_reference(make_dataset):
+    pixels = np.linspace(-1024, 3071, 64 * 64).astype(np.int16).reshape(64, 64)
+    ds = make_dataset(pixels, RescaleSlope=1, RescaleIntercept=-24, WindowCenter=40, WindowWidth=400)
+
+    out, window = window_to_uint8(pixels, ds, "CT")
+
+    hu = pixels.astype(np.float64) - 24
+    expected = np.clip(((hu - 39.5) / 399 + 0.5) * 255, 0, 255)
+    assert out.dtype == np.uint8
+    assert np.abs(out.astype(int) - np.rint(expected)).max() <= 1
+    assert window.source == "dicom"
+
+
+def test_monochrome1_is_inverted_and_preset_overrides_file(make_dataset):
+    pixels = np.array([[0, 4095], [2048, 1024]], dtype=np.uint16)
+    ds = make_dataset(pixels, PhotometricInterpretation="MONOCHROME1", WindowCenter=2048, WindowWidth=4096)
+
+    out, _ = window_to_uint8(pixels, ds, "CR")
+    assert out[0, 0] == 255 and out[0, 1] == 0
+
+    _, window = window_to_uint8(pixels, make_dataset(pixels, WindowCenter=40, WindowWidth=400), "CT", preset="lung")
+    assert window.source == "preset:lung"
+
+
+def test_process_dicom_without_window_stretches_data_range(tmp_path, make_dataset):
+    pixels = (np.arange(96 * 96, dtype=np.uint16).reshape(96, 96) % 1000) + 500
+    ds = make_dataset(pixels, Modality="DX")
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+
+    processor = ImageProcessor(upload_dir=str(tmp_path), thumbnail_dir=str(tmp_path))
+    image, metadata = processor.process_dicom(buffer.getvalue())
+    values = np.asarray(image)
+    assert values.min() == 0 and values.max() == 255
+    assert metadata["window"]["source"] == "data_range"
+
@@ -0,0 +1,45 @@
+import io
+import os
+import hashlib
+import pytest
+from httpx import AsyncClient
+from PIL import Image
+from app.routers import medical_imaging
+
+
+@pytest.fixture(autouse=True)
+def isolated_upload_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(medical_imaging.image_processor, "upload_dir", str(tmp_path))
+    monkeypatch.setattr(medical_imaging.image_processor, "thumbnail_dir", str(tmp_path))
+    monkeypatch.setattr(medical_imaging.upload_parser, "spool_dir", str(tmp_path))
+    return tmp_path
+
+
+def png_bytes(size=(96, 96)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", size, color=120).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_streamed_upload_is_hashed_and_spool_removed(async_client: AsyncClient, isolated_upload_dirs):
+    content = png_bytes()
+    response = await async_client.post("/api/upload-image", files={"file": ("scan.png", content, "image/png")})
+
+    assert response.status_code == 200
+    assert response.json()["upload_sha256"] == hashlib.sha256(content).hexdigest()
+    assert not [name for name in os.listdir(isolated_upload_dirs) if name.endswith(".upload")]
+
+
+@pytest.mark.asyncio
+async def test_oversize_upload_is_rejected(async_client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(medical_imaging.upload_parser, "max_size", 1024)
+    content = png_bytes((512, 512)) + os.urandom(4096)
+    response = await async_client.post("/api/upload-image", files={"file": ("scan.png", content, "image/png")})
+    assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_content_not_matching_signature_is_rejected(async_client: AsyncClient):
+    response = await async_client.post("/api/upload-image", files={"file": ("scan.jpg", b"not an image" * 20, "image/jpeg")})
+    assert response.status_code == 400
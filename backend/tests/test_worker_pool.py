@@ -0,0 +1,43 @@
+import io
+import asyncio
+import threading
+import pytest
+from PIL import Image
+from app.services.worker_pool import WorkerPool, PoolBusyError
+from app.services.image_processor import ImageProcessor
+
+
+@pytest.mark.asyncio
+async def test_pool_rejects_when_queue_is_full():
+    pool = WorkerPool(mode="thread", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    running = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    assert pool.pending == 2
+
+    with pytest.raises(PoolBusyError):
+        await pool.run(release.wait)
+
+    release.set()
+    await asyncio.gather(*running)
+    assert pool.pending == 0
+    assert pool.stats()["rejected"] == 1
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_save_and_process_runs_in_pool(tmp_path):
+    buffer = io.BytesIO()
+    Image.new("L", (128, 96), color=80).save(buffer, "PNG")
+
+    processor = ImageProcessor(
+        upload_dir=str(tmp_path),
+        thumbnail_dir=str(tmp_path / "thumbnails"),
+        pool=WorkerPool(mode="thread", max_workers=1, max_queue=0),
+    )
+    image_data = await processor.save_and_process(buffer.getvalue(), "scan.png")
+
+    assert image_data.metadata.width == 128
+    assert (tmp_path / f"{image_data.image_id}.png").exists()
+    assert image_data.content_hash